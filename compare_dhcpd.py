@@ -1,13 +1,39 @@
 #!/usr/bin/env python3
 
+import os
+import stat
 import sys
 import re
+import mmap
+import socket
+import struct
 import argparse
 from collections import defaultdict
+from operator import itemgetter
 
 # Configuration: Set the sort key to 'mac' or 'ip'
 SORT_KEY = 'mac'  # Change to 'ip' if needed
 
+# Regular expression to extract MAC and IP pairs in a single pass over the file.
+# Matches whole lines, so the line text comes from the match itself. Each field
+# is looked up independently, so dhcpd's either-order form is accepted, and
+# fields after a '#' on the same line are never matched.
+PAIR_RE = re.compile(
+    rb'^(?=[^\n#]*?hardware\s+ethernet\s+([0-9A-Fa-f:]+)\s*;)'
+    rb'(?=[^\n#]*?fixed-address\s+([0-9.]+)\s*;)'
+    rb'([^\n]*)',
+    re.MULTILINE)
+
+# Uppercases the hex digits of a MAC address on bytes, before decoding
+MAC_UPPER = bytes.maketrans(b'abcdef', b'ABCDEF')
+
+def iter_pairs(data):
+    """
+    Yields (mac, ip, line) for every host entry in a dhcpd.conf buffer.
+    """
+    for mac, ip, line in map(re.Match.groups, PAIR_RE.finditer(data)):
+        yield mac.translate(MAC_UPPER).decode('ascii'), ip.decode('ascii'), line.decode().strip()
+
 def parse_dhcpd_conf(file_path):
     """
     Parses a dhcpd.conf file and extracts MAC-IP pairs.
@@ -23,35 +49,34 @@ def parse_dhcpd_conf(file_path):
     mac_to_line = {}
     ip_to_line = {}
 
-    # Regular expressions to extract MAC and IP
-    mac_regex = re.compile(r'hardware\s+ethernet\s+([0-9A-Fa-f:]+)\s*;')
-    ip_regex = re.compile(r'fixed-address\s+([0-9.]+)\s*;')
-
-    with open(file_path, 'r') as f:
-        for line_number, line in enumerate(f, 1):
-            # Remove comments
-            line_no_comment = line.split('#')[0]
-            mac_match = mac_regex.search(line_no_comment)
-            ip_match = ip_regex.search(line_no_comment)
-
-            if mac_match and ip_match:
-                mac = mac_match.group(1).upper()
-                ip = ip_match.group(1)
-                mac_to_ip[mac] = ip
-                ip_to_mac[ip] = mac
-                mac_to_line[mac] = line.strip()
-                ip_to_line[ip] = line.strip()
-            else:
-                # Line doesn't match expected format; ignore or handle as needed
-                continue
+    with open(file_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        # Only non-empty regular files can be mapped; pipes report size 0
+        if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                pairs = list(iter_pairs(data))
+        else:
+            pairs = iter_pairs(f.read())
+
+        for mac, ip, line in pairs:
+            mac_to_ip[mac] = ip
+            ip_to_mac[ip] = mac
+            mac_to_line[mac] = line
+            ip_to_line[ip] = line
 
     return mac_to_ip, ip_to_mac, mac_to_line, ip_to_line
 
-def sort_ips(ip_list):
+def ip_key(ip):
     """
-    Sorts a list of IP addresses in ascending order.
+    Returns a sort key for an IP address.
+
+    Valid dotted-quad addresses are packed into a 32-bit integer. Anything
+    else (short forms, octets above 255) sorts after them by its numeric parts.
     """
-    return sorted(ip_list, key=lambda ip: tuple(int(part) for part in ip.split('.')))
+    try:
+        return (struct.unpack('!I', socket.inet_pton(socket.AF_INET, ip))[0],)
+    except OSError:
+        return (1 << 32,) + tuple(int(p) if p else -1 for p in ip.split('.'))
 
 def sort_macs(mac_list):
     """
@@ -59,6 +84,20 @@ def sort_macs(mac_list):
     """
     return sorted(mac_list)
 
+def find_mismatches(map1, map2):
+    """
+    Finds keys present in both mappings with different values.
+
+    Returns:
+        list of (key, value in map1, value in map2) tuples
+    """
+    # Walk the smaller mapping and probe the larger one
+    if len(map1) <= len(map2):
+        return [(k, v1, v2) for k, v1 in map1.items()
+                if (v2 := map2.get(k)) is not None and v1 != v2]
+    return [(k, v1, v2) for k, v2 in map2.items()
+            if (v1 := map1.get(k)) is not None and v1 != v2]
+
 def main():
     parser = argparse.ArgumentParser(description='Compare two dhcpd.conf files.')
     parser.add_argument('file1', help='First dhcpd.conf file path')
@@ -69,54 +108,38 @@ def main():
     mac_to_ip1, ip_to_mac1, mac_to_line1, ip_to_line1 = parse_dhcpd_conf(args.file1)
     mac_to_ip2, ip_to_mac2, mac_to_line2, ip_to_line2 = parse_dhcpd_conf(args.file2)
 
-    # Create sets of (mac, ip) tuples
-    set1 = set(mac_to_ip1.items())
-    set2 = set(mac_to_ip2.items())
+    # (mac, ip) pairs; dict item views support set operations directly
+    items1 = mac_to_ip1.items()
+    items2 = mac_to_ip2.items()
 
     # Calculate matching and missing pairs
-    matching = set1 & set2
-    missing_in_first = set2 - set1
-    missing_in_second = set1 - set2
+    matching = items1 & items2
+    missing_in_first = items2 - items1
+    missing_in_second = items1 - items2
 
     # Calculate IP mismatches
-    common_macs = set(mac_to_ip1.keys()) & set(mac_to_ip2.keys())
-    ip_mismatches = []
-    for mac in common_macs:
-        ip1 = mac_to_ip1[mac]
-        ip2 = mac_to_ip2[mac]
-        if ip1 != ip2:
-            ip_mismatches.append((mac, ip1, ip2))
+    ip_mismatches = find_mismatches(mac_to_ip1, mac_to_ip2)
 
     # Calculate MAC mismatches
-    common_ips = set(ip_to_mac1.keys()) & set(ip_to_mac2.keys())
-    mac_mismatches = []
-    for ip in common_ips:
-        mac1 = ip_to_mac1[ip]
-        mac2 = ip_to_mac2[ip]
-        if mac1 != mac2:
-            mac_mismatches.append((ip, mac1, mac2))
+    mac_mismatches = find_mismatches(ip_to_mac1, ip_to_mac2)
 
     # Output missing lines
     print(f"Missing in {args.file1} (present in {args.file2}, not in {args.file1}):")
     if missing_in_first:
-        missing_in_first_sorted = sort_ips([ip for mac, ip in missing_in_first])
-        for ip in missing_in_first_sorted:
-            # Find the corresponding MAC
-            mac = ip_to_mac2.get(ip)
-            if mac and (mac, ip) in missing_in_first:
-                print(mac_to_line2[mac])
+        # Sort the (mac, ip) pairs by IP directly
+        missing_in_first_sorted = sorted((ip_key(ip), mac) for mac, ip in missing_in_first)
+        for _, mac in missing_in_first_sorted:
+            print(mac_to_line2[mac])
     else:
         print("None")
     print()
 
     print(f"Missing in {args.file2} (present in {args.file1}, not in {args.file2}):")
     if missing_in_second:
-        missing_in_second_sorted = sort_ips([ip for mac, ip in missing_in_second])
-        for ip in missing_in_second_sorted:
-            # Find the corresponding MAC
-            mac = ip_to_mac1.get(ip)
-            if mac and (mac, ip) in missing_in_second:
-                print(mac_to_line1[mac])
+        # Sort the (mac, ip) pairs by IP directly
+        missing_in_second_sorted = sorted((ip_key(ip), mac) for mac, ip in missing_in_second)
+        for _, mac in missing_in_second_sorted:
+            print(mac_to_line1[mac])
     else:
         print("None")
     print()
@@ -124,7 +147,7 @@ def main():
     # Output IP mismatches
     print(f"IP Mismatches (Same MAC, different IPs) between {args.file1} and {args.file2}:")
     if ip_mismatches:
-        ip_mismatches_sorted = sorted(ip_mismatches, key=lambda x: x[0])  # Sort by MAC
+        ip_mismatches_sorted = sorted(ip_mismatches, key=itemgetter(0))  # Sort by MAC
         for mac, ip1, ip2 in ip_mismatches_sorted:
             print(f"MAC {mac}: {args.file1} has IP {ip1} vs {args.file2} has IP {ip2}")
     else:
@@ -134,8 +157,9 @@ def main():
     # Output MAC mismatches
     print(f"MAC Mismatches (Same IP, different MACs) between {args.file1} and {args.file2}:")
     if mac_mismatches:
-        mac_mismatches_sorted = sorted(mac_mismatches, key=lambda x: tuple(int(part) for part in x[0].split('.')))  # Sort by IP
-        for ip, mac1, mac2 in mac_mismatches_sorted:
+        # Sort by IP, parsing each address once
+        mac_mismatches_sorted = sorted((ip_key(ip), ip, mac1, mac2) for ip, mac1, mac2 in mac_mismatches)
+        for _, ip, mac1, mac2 in mac_mismatches_sorted:
             print(f"IP {ip}: {args.file1} has MAC {mac1} vs {args.file2} has MAC {mac2}")
     else:
         print("None")
@@ -1,16 +1,17 @@
 #!/usr/bin/env python
 
 import os
+import atexit
+import queue
 import tempfile
-import shutil
 import logging
 import logging.handlers
 import re
 import requests
 import sys
+import signal
 import subprocess
 import hashlib
-import time
 import tty
 import configuration
 
@@ -18,6 +19,33 @@ logger = logging.getLogger(__name__)
 
 last_hash = None
 
+# Validators of the last NetBox response, for conditional requests
+last_etag = None
+last_modified = None
+
+# SHA256 digest of the last NetBox response written to the output file
+last_digest = None
+
+# file path -> ((size, mtime_ns), sha256 digest)
+digest_cache = {}
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# Seconds between polls of NetBox
+POLL_INTERVAL = 30
+
+# Reused across polls to keep the NetBox connection alive
+session = requests.Session()
+session.headers.update({"Authorization": f"Token {configuration.NETBOX_API_TOKEN}"})
+
+# No optional leading/trailing parts: they never affect matching, only slow it down
+RESERVATION_RE = re.compile(
+  rb"host\s+\w+\s*{"
+  rb"\s*hardware\s+ethernet\s+[0-9a-fA-F:]+\s*;"
+  rb"\s*fixed-address\s+[0-9\.]+\s*;"
+  rb"\s*}"
+)
+
 
 def setup_logging():
   # Configure logging to syslog
@@ -25,29 +53,51 @@ def setup_logging():
   syslog_handler = logging.handlers.SysLogHandler(address = '/dev/log')
   formatter = logging.Formatter(fmt='%(module)s: %(message)s')
   syslog_handler.setFormatter(formatter)
-  logger.addHandler(syslog_handler)
+  handlers = [syslog_handler]
   if os.isatty(sys.stdout.fileno()):  # Check if stdout is a terminal
     stderr_handler = logging.StreamHandler(sys.stderr)
   #  stderr_handler.setFormatter(formatter)
-    logger.addHandler(stderr_handler)
+    handlers.append(stderr_handler)
+
+  # Emit from a background thread so logging calls do not block on /dev/log
+  log_queue = queue.SimpleQueue()
+  logger.addHandler(logging.handlers.QueueHandler(log_queue))
+  listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+  listener.start()
+  # Flush pending records before the process exits
+  atexit.register(listener.stop)
 
 
 def get_data():
+  """Fetch the export from NetBox, or return None if it has not been modified."""
+  global last_etag, last_modified
+
   url = f"{configuration.NETBOX_API_URL}/api/ipam/ip-addresses"
   params = {"export": f"{configuration.NETBOX_TEMPLATE}"}
-  headers = {"Authorization": f"Token {configuration.NETBOX_API_TOKEN}"}
+  headers = {}
+  if last_etag:
+    headers["If-None-Match"] = last_etag
+  if last_modified:
+    headers["If-Modified-Since"] = last_modified
 
   try:
     api_timeout = 60
-    response = requests.get(url, headers=headers, params=params, timeout=api_timeout)
+    response = session.get(url, headers=headers, params=params, timeout=api_timeout)
     response.raise_for_status()  # Raises HTTPError if status code is 4xx or 5xx
 
+    if response.status_code == 304:
+      logger.debug("NetBox API call succeeded, data not modified.")
+      return None
+
     ctype = response.headers.get("content-type", "")
     if 'text/plain' not in ctype:
         raise ValueError(f"Unexpected content-type: {ctype}")
 
+    last_etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+
     logger.debug("NetBox API call succeeded.")
-    return response.text
+    return response.content
 
   except requests.exceptions.Timeout:
     logger.error("NetBox API call timed out.")
@@ -61,14 +111,16 @@ def get_data():
 def write_temp_file(data, temp_dir):
     temp_fd, temp_path = tempfile.mkstemp(dir=temp_dir)
     try:
-        with os.fdopen(temp_fd, 'w') as temp_file:
-            temp_file.write(data)
-        os.chmod(temp_path, 0o644)
-        return temp_path
+        view = memoryview(data)
+        while view:
+            view = view[os.write(temp_fd, view):]
+        os.fchmod(temp_fd, 0o644)
     except Exception as e:
         os.close(temp_fd)
         os.remove(temp_path)
         raise e
+    os.close(temp_fd)
+    return temp_path
 
 
 def reload_dhcpd():
@@ -95,40 +147,78 @@ def reload_dhcpd():
     raise
 
 
+def file_digest(file_path):
+    """Return the SHA256 digest of a file, reusing the cached one while its size and mtime are unchanged."""
+    st = os.stat(file_path)
+    fingerprint = (st.st_size, st.st_mtime_ns)
+    cached = digest_cache.get(file_path)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    hash_obj = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hash_obj.update(chunk)
+
+    digest = hash_obj.digest()
+    digest_cache[file_path] = (fingerprint, digest)
+    return digest
+
+
+def remember_digest(file_path, digest):
+    """Record the digest of data just written to file_path so it is not read back."""
+    st = os.stat(file_path)
+    digest_cache[file_path] = ((st.st_size, st.st_mtime_ns), digest)
+
+
 def compute_file_hashes(conf_dir):
     """Compute the combined SHA256 hash of all dhcpd*.conf files."""
     hash_obj = hashlib.sha256()
 
-    for filename in os.listdir(conf_dir):
-        if filename.startswith("dhcpd") and filename.endswith(".conf"):
-            file_path = os.path.join(conf_dir, filename)
-            if os.path.isfile(file_path):
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-                    hash_obj.update(file_data)
-
-    return hash_obj.hexdigest()
+    with os.scandir(conf_dir) as it:
+        entries = [e for e in it if e.name.startswith("dhcpd") and e.name.endswith(".conf") and e.is_file()]
 
+    # Sorted so the digest does not depend on directory order
+    for entry in sorted(entries, key=lambda e: e.name):
+        hash_obj.update(entry.name.encode())
+        hash_obj.update(file_digest(entry.path))
 
-def poll(conf_dir, target_path):
-  global last_hash
+    return hash_obj.hexdigest()
 
-  text = get_data()
 
-  regex = re.compile(
-    r"\s*host\s+\w+\s*{"
-    r"\s*hardware\s+ethernet\s+[0-9a-fA-F:]+\s*;"
-    r"\s*fixed-address\s+[0-9\.]+\s*;"
-    r"\s*}\s*#*"
-  )
+def update_target(conf_dir, target_path, data):
+  global last_digest
 
-  linecount = sum(bool(regex.search(line)) for line in text.split("\n"))
+  # The raw response bytes are counted, hashed and written as is
+  linecount = sum(1 for _ in RESERVATION_RE.finditer(data))
   if linecount < 1:
     raise Exception('No DHCP reservations in NetBox response, aborting')
 
-  temp_path = write_temp_file(text, conf_dir)
-  shutil.move(temp_path, target_path)
-  logger.info(f"Updated {target_path}, {linecount} dhcp reservations")
+  # Leave the file alone if it already holds exactly this content
+  digest = hashlib.sha256(data).digest()
+  if os.path.isfile(target_path) and file_digest(target_path) == digest:
+    logger.debug(f"{target_path} is up to date, {linecount} dhcp reservations")
+  else:
+    temp_path = write_temp_file(data, conf_dir)
+    os.replace(temp_path, target_path)
+    remember_digest(target_path, digest)
+    logger.info(f"Updated {target_path}, {linecount} dhcp reservations")
+  last_digest = digest
+
+
+def poll(conf_dir, target_path):
+  global last_hash, last_etag, last_modified
+
+  # A 304 only means NetBox is unchanged; if the output file no longer holds
+  # the last response (edited or removed), fetch the full body to restore it
+  if not (last_digest is not None and os.path.isfile(target_path)
+          and file_digest(target_path) == last_digest):
+    last_etag = None
+    last_modified = None
+
+  data = get_data()
+  if data is not None:
+    update_target(conf_dir, target_path, data)
 
   current_hash = compute_file_hashes(conf_dir)
   # Only process and reload dhcpd if the hash has changed
@@ -141,6 +231,10 @@ def poll(conf_dir, target_path):
 
 def main():
 
+  # Block SIGUSR1 before any thread is started so that it is only ever
+  # consumed by sigtimedwait() in the main loop instead of terminating us
+  signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGUSR1])
+
   setup_logging()
 
   # Startup checks
@@ -165,7 +259,9 @@ def main():
   while True:
     try:
       poll(conf_dir, target_path)
-      time.sleep(30)
+      # Wait for the next poll; SIGUSR1 forces an immediate one
+      if signal.sigtimedwait([signal.SIGUSR1], POLL_INTERVAL) is not None:
+        logger.info("SIGUSR1 received, polling NetBox now.")
 
     except Exception as e:
       logger.error(f"{e}")